@@ -1,10 +1,498 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import hashlib
+import io
 import os
+import re
+import stat
+import tempfile
+
+# PyArrow parses CSVs multi-threaded into Arrow-backed columns; fall back to
+# pandas' default C parser when it is not installed.
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pv
+except ImportError:
+    pa = pv = None
+
+# Copy-on-Write lets the derived frames share columns with their parent until written;
+# it is always on from pandas 3, where the option is deprecated
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# Report headers seen in the wild, mapped onto the names used below
+RENAME_MAP = {'SalePerson': 'SalesPerson', 'Date': 'BillDate', 'Bill Date': 'BillDate', 'BillDate': 'BillDate'}
+
+# The only report columns the dashboard uses; everything else is skipped at parse time
+REQUIRED_COLS = ['BillDate', 'SalesPerson', 'InvoiceNumber', 'Quantity', 'GSV', 'Category', 'SubCategory', 'ProductName']
+REQUIRED_COLUMNS = frozenset(REQUIRED_COLS)
+
+# String keys that are dictionary-encoded while parsing and kept as categoricals
+KEY_COLS = ['SalesPerson', 'Category', 'SubCategory', 'ProductName', 'InvoiceNumber']
+
+# Columns read as dictionaries: the keys, plus BillDate so each distinct date string is parsed once
+DICT_COLS = frozenset(KEY_COLS + ['BillDate'])
+
+# Columns the dashboard reads from each stream after the split
+SALES_COLS = ['SalesPerson', 'GSV', 'Quantity', 'InvoiceNumber', 'Category', 'SubCategory', 'BillDate', 'Day', 'Week', 'Week_Label']
+MEMBERSHIP_COLS = ['BillDate', 'GSV']
+
+# Parsed reports are kept here as Parquet, keyed by a hash of the uploaded bytes;
+# bump the version whenever read_report() changes what it parses
+PARQUET_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'fc_cache')
+PARQUET_CACHE_VERSION = 4
+# Only the most recently used reports are kept; older copies are deleted on each write
+PARQUET_CACHE_MAX_FILES = 8
+
+# Day-first date layouts the POS exports use; anything else goes through pandas' inference
+DATE_FORMATS = [(r'\d{1,2}/\d{1,2}/\d{4}', '%d/%m/%Y'), (r'\d{1,2}-\d{1,2}-\d{4}', '%d-%m-%Y')]
+
+# Days 1-7 of the month are Week 1, ..., days 29-31 are Week 5
+WEEK_LABELS = [f"Week {i}" for i in range(1, 6)]
+
+# Long day-by-day tables are sent to the browser one page (newest first) at a time
+PAGE_ROWS = 30
+
+# 'Day' is a categorical over the weekday names; its codes are the weekday number (Mon=0)
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(page_title="FirstCry Store Dashboard", layout="wide")
 
+
+# --- CACHED DATA PIPELINE ---
+def file_digest(file_bytes: bytes) -> str:
+    # Content key for an upload; computed once per rerun and used by every cache below
+    return hashlib.blake2b(file_bytes, digest_size=8).hexdigest()
+
+
+def read_report(file_bytes: bytes, digest: str) -> pd.DataFrame:
+    # A Parquet copy of each parsed report survives app restarts, so uploading the
+    # same file again skips the CSV parse entirely.
+    cache_dir = parquet_cache_dir()
+    cache_path = cache_dir and os.path.join(cache_dir, f"{digest}-v{PARQUET_CACHE_VERSION}.parquet")
+    if cache_path and os.path.exists(cache_path):
+        try:
+            df = pd.read_parquet(cache_path)
+            os.utime(cache_path)  # mark as recently used for prune_parquet_cache()
+            return df
+        except Exception:
+            pass
+
+    # Sniff the header first so only the needed columns are parsed, then hand back
+    # stripped, renamed column names. Key columns are dictionary-encoded as they are
+    # read, so a large report never holds one Python string per row for them.
+    if pv is not None:
+        header = pv.open_csv(pa.BufferReader(file_bytes)).schema.names
+    else:
+        header = pd.read_csv(io.BytesIO(file_bytes), nrows=0).columns
+    names = {c: RENAME_MAP.get(c.strip(), c.strip()) for c in header}
+    missing = REQUIRED_COLUMNS - set(names.values())
+    if missing:
+        raise ValueError(f"Report is missing columns: {', '.join(c for c in REQUIRED_COLS if c in missing)}")
+    usecols = [c for c in header if names[c] in REQUIRED_COLUMNS]
+
+    if pv is not None:
+        column_types = {}
+        for c in usecols:
+            if names[c] == 'GSV':
+                column_types[c] = pa.float64()
+            elif names[c] in DICT_COLS:
+                column_types[c] = pa.dictionary(pa.int32(), pa.string())
+        table = pv.read_csv(
+            pa.BufferReader(file_bytes),
+            convert_options=pv.ConvertOptions(include_columns=usecols, column_types=column_types, strings_can_be_null=True)
+        )
+        table = table.rename_columns([names[c] for c in table.column_names])
+        # Dictionary columns arrive as pandas categoricals, the rest stay Arrow-backed
+        df = table.to_pandas(types_mapper=lambda t: None if pa.types.is_dictionary(t) else pd.ArrowDtype(t))
+    else:
+        key_dtypes = {c: 'category' for c in usecols if names[c] in DICT_COLS}
+        df = pd.read_csv(io.BytesIO(file_bytes), usecols=usecols, dtype=key_dtypes)
+        df.columns = [names[c] for c in df.columns]
+
+    if cache_path:
+        try:
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            df.to_parquet(tmp_path, compression='zstd')
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, cache_path)
+            prune_parquet_cache(cache_dir)
+        except Exception:
+            pass  # the side-cache is best effort (no pyarrow, read-only disk, ...)
+    return df
+
+
+def parquet_cache_dir() -> str | None:
+    # The cached reports hold staff names, invoices and GSV: keep the directory
+    # private to this user, and skip the cache if someone else owns that path
+    try:
+        os.makedirs(PARQUET_CACHE_DIR, mode=0o700, exist_ok=True)
+        info = os.lstat(PARQUET_CACHE_DIR)
+        if not stat.S_ISDIR(info.st_mode) or (hasattr(os, 'getuid') and info.st_uid != os.getuid()):
+            return None
+        if info.st_mode & 0o077:
+            os.chmod(PARQUET_CACHE_DIR, 0o700)
+    except OSError:
+        return None
+    return PARQUET_CACHE_DIR
+
+
+def prune_parquet_cache(cache_dir: str, keep: int = PARQUET_CACHE_MAX_FILES) -> None:
+    # Drop all but the newest cached reports, including copies from older cache
+    # versions and temp files left by an interrupted write
+    with os.scandir(cache_dir) as it:
+        entries = sorted((e for e in it if e.is_file()), key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in entries[keep:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def sorted_categorical(col: pd.Series, strip: bool = False) -> pd.Series:
+    # Categorical with sorted (optionally stripped) categories. The clean-up runs on
+    # the distinct labels and codes are remapped, so no per-row string is touched.
+    cat = col.astype('category').cat
+    labels = cat.categories.str.strip() if strip else cat.categories
+    uniques, inverse = np.unique(labels.to_numpy(), return_inverse=True)
+    codes = np.append(inverse, -1)[cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=uniques), index=col.index, name=col.name)
+
+
+def parse_bill_dates(raw: pd.Series) -> pd.Series:
+    # Sniff the layout from the first date so pandas can take its fixed-format
+    # fast path; values it misses get the other known layouts, and only what none
+    # of them fit goes through day-first inference
+    if isinstance(raw.dtype, pd.CategoricalDtype):
+        # A month of bills has ~30 distinct dates: parse those and broadcast via the codes
+        parsed = parse_bill_dates(pd.Series(raw.cat.categories)).to_numpy()
+        parsed = np.append(parsed, np.array(['NaT'], dtype=parsed.dtype))
+        return pd.Series(parsed[raw.cat.codes.to_numpy()], index=raw.index, name=raw.name)
+
+    first = raw.dropna().head(1)
+    text = str(first.iloc[0]).strip() if len(first) else ''
+    sniffed = [fmt for pattern, fmt in DATE_FORMATS if re.fullmatch(pattern, text)]
+    if not sniffed:
+        return pd.to_datetime(raw, dayfirst=True, errors='coerce')
+
+    parsed = pd.to_datetime(raw, format=sniffed[0], errors='coerce', cache=True)
+    todo = parsed.isna() & raw.notna()
+    for fmt in [fmt for _, fmt in DATE_FORMATS if fmt != sniffed[0]]:
+        if not todo.any():
+            return parsed
+        parsed[todo] = pd.to_datetime(raw[todo], format=fmt, errors='coerce', cache=True)
+        todo &= parsed.isna()
+    if todo.any():
+        parsed[todo] = pd.to_datetime(raw[todo], dayfirst=True, errors='coerce')
+    return parsed
+
+
+# Streamlit re-runs the whole script on every widget interaction, so everything
+# derived from the upload is built once per file and memoized on its digest (the
+# underscore keeps Streamlit from hashing the raw bytes again on every call). The
+# bundle is shared (cache_resource, no per-rerun copy) and treated as read-only;
+# only the last few uploads are kept so memory stays bounded.
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_and_prepare(digest: str, _file_bytes: bytes) -> dict:
+    # 1. LOAD & CLEAN
+    df = read_report(_file_bytes, digest)
+
+    # Keys as categoricals: groupbys hash small integer codes. The displayed keys get
+    # sorted categories, and stray spaces around a name would otherwise split one
+    # salesperson into two; invoice and product codes only need to be distinct.
+    for col in ('SalesPerson', 'Category', 'SubCategory'):
+        df[col] = sorted_categorical(df[col], strip=(col == 'SalesPerson'))
+    for col in ('ProductName', 'InvoiceNumber'):
+        df[col] = df[col].astype('category')
+
+    # Quantities fit a narrow integer; GSV stays float64 so rupee totals keep their paise
+    df['Quantity'] = pd.to_numeric(df['Quantity'], downcast='integer')
+
+    # 2. DATE FIX
+    df['BillDate'] = parse_bill_dates(df['BillDate']).dt.floor('D')
+    df = df.dropna(subset=['BillDate'])
+
+    # Newest first, once: date groupbys with sort=False then come out display-ordered
+    df = df.sort_values('BillDate', ascending=False)
+
+    # 3. WEEK LOGIC
+    # Both derived from one datetime64[D] array: day of month, and weekday (1970-01-01 was a Thursday)
+    days = df['BillDate'].to_numpy(dtype='datetime64[D]')
+    week = ((days - days.astype('datetime64[M]')).astype(np.int64) // 7 + 1).astype(np.int8)
+    df['Week'] = week
+    df['Week_Label'] = pd.Categorical.from_codes(week - 1, categories=WEEK_LABELS)
+    df['Day'] = pd.Categorical.from_codes(((days.astype(np.int64) + 3) % 7).astype(np.int8), categories=DAY_NAMES, ordered=True)
+
+    # 4. SEPARATE STREAMS
+    # Project only the columns each stream reads; .loc already returns a new frame
+    # Both tests run on the distinct categories and are broadcast to rows through the codes
+    names = df['ProductName'].cat.categories
+    cats = df['Category'].cat.categories
+    mask_mem = (
+        rows_matching(df['ProductName'], names.str.contains('Membership', case=False, regex=False))
+        | rows_matching(df['Category'], cats == 'GiftCertificate')
+    )
+    df_memberships = df.loc[mask_mem, MEMBERSHIP_COLS]
+
+    # Label the handful of distinct membership prices once
+    price_tier = df_memberships['GSV'].astype('category').cat.rename_categories(
+        lambda v: f"₹{int(v)}" if float(v).is_integer() else f"₹{v}"  # GSV is parsed as float64
+    )
+    df_memberships = df_memberships.assign(Price_Tier=price_tier)
+
+    # The exclusion is decided on the categories; most reports carry no free samples,
+    # and then df_sales is a plain column projection with no row filter at all
+    exclusions = ['Free Sample Category']
+    excluded = cats.isin(exclusions)
+    if excluded.any():
+        df_sales = df.loc[~rows_matching(df['Category'], excluded), SALES_COLS]
+    else:
+        df_sales = df[SALES_COLS]
+
+    return {
+        'df': df,
+        'df_sales': df_sales,
+        'df_memberships': df_memberships,
+        'master_df': compute_master(df_sales),
+        'cat_agg': category_agg(df_sales),
+        'sub_cats_by_cat': category_options(df_sales),
+        'weekly_kpi': compute_weekly(df_sales),
+        'day_mem': membership_by_day(df_memberships),
+        'day_view': sales_by_day(df_sales),
+        'week_view': sales_by_week(df_sales),
+    }
+
+
+def rows_matching(col: pd.Series, category_hits: np.ndarray) -> np.ndarray:
+    # Row mask from a per-category boolean; missing values (code -1) never match
+    return np.append(np.asarray(category_hits, dtype=bool), False)[col.cat.codes.to_numpy()]
+
+
+def staff_kpis(sp_codes: np.ndarray, inv_codes: np.ndarray, gsv: np.ndarray, qty: np.ndarray, n_sp: int) -> pd.DataFrame:
+    # Per-salesperson-code totals from plain column arrays: row count, GSV, quantity,
+    # bills and single-item bills. A bill is one (invoice, salesperson) pair;
+    # rows with a missing key (code -1) are skipped.
+    has_sp = sp_codes >= 0
+    rows = np.bincount(sp_codes[has_sp], minlength=n_sp)
+    total_gsv = np.bincount(sp_codes[has_sp], weights=gsv[has_sp], minlength=n_sp)
+    total_qty = np.bincount(sp_codes[has_sp], weights=qty[has_sp], minlength=n_sp)
+    if np.issubdtype(qty.dtype, np.integer):
+        total_qty = total_qty.astype(np.int64)
+
+    valid = has_sp & (inv_codes >= 0)
+    pair_keys = inv_codes[valid].astype(np.int64) * n_sp + sp_codes[valid]
+    n_keys = (int(inv_codes.max()) + 1) * n_sp if inv_codes.size else 0
+    if n_keys <= 2 * pair_keys.size:
+        # Dense key space: address bills directly by key instead of hashing them
+        pairs = np.flatnonzero(np.bincount(pair_keys, minlength=n_keys))
+        bill_qty = np.bincount(pair_keys, weights=qty[valid], minlength=n_keys)[pairs]
+    else:
+        pair_codes, pairs = pd.factorize(pair_keys)
+        bill_qty = np.bincount(pair_codes, weights=qty[valid])
+    bill_sp = pairs % n_sp
+    bills = np.bincount(bill_sp, minlength=n_sp)
+    single = np.bincount(bill_sp[bill_qty == 1], minlength=n_sp)
+
+    return pd.DataFrame({
+        'Rows': rows, 'Total_GSV': total_gsv, 'Total_Qty': total_qty,
+        'Total_Bills': bills, 'Single_Bills': single
+    })
+
+
+def compute_master(df_sales: pd.DataFrame) -> pd.DataFrame:
+    # 5. MASTER KPI CALCULATIONS (GSV) -- one pass over the needed columns as arrays
+    sp = df_sales['SalesPerson'].cat
+    master_df = staff_kpis(
+        sp.codes.to_numpy(),
+        df_sales['InvoiceNumber'].cat.codes.to_numpy(),
+        df_sales['GSV'].to_numpy(dtype=np.float64, na_value=0),
+        df_sales['Quantity'].to_numpy(na_value=0),
+        len(sp.categories)
+    )
+    master_df.insert(0, 'SalesPerson', sp.categories)
+    master_df = master_df[master_df['Rows'] > 0].reset_index(drop=True)
+
+    # Ratios, on the raw arrays; a staff member with no counted bills is shown as one bill
+    bills = master_df['Total_Bills'].to_numpy()
+    bills = np.where(bills == 0, 1, bills)
+    master_df['Total_Bills'] = bills
+    master_df['AVPT'] = np.round(master_df['Total_GSV'].to_numpy() / bills, 0)
+    master_df['AUPT'] = np.round(master_df['Total_Qty'].to_numpy() / bills, 2)
+    master_df['Single_Bill_%'] = np.round((master_df['Single_Bills'].to_numpy() / bills) * 100, 1)
+
+    # Ranking
+    master_df = master_df.sort_values('Total_GSV', ascending=False).reset_index(drop=True)
+    master_df.index += 1
+    master_df['Rank'] = master_df.index
+    return master_df[['Rank', 'SalesPerson', 'Total_GSV', 'Total_Qty', 'Total_Bills', 'AVPT', 'AUPT', 'Single_Bills', 'Single_Bill_%']]
+
+
+def count_bills_per_staff(frame: pd.DataFrame, by: tuple = ('SalesPerson',)) -> pd.Series:
+    # Distinct invoices per salesperson (or per `by` keys): pack the key and InvoiceNumber
+    # codes into one int64 per row, dedupe those integers and count per group
+    codes, labels = [], []
+    for col in (*by, 'InvoiceNumber'):
+        if isinstance(frame[col].dtype, pd.CategoricalDtype):
+            codes.append(frame[col].cat.codes.to_numpy().astype(np.int64))
+            labels.append(frame[col].cat.categories)
+        else:
+            col_codes, col_labels = pd.factorize(frame[col], sort=True)
+            codes.append(col_codes.astype(np.int64))
+            labels.append(col_labels)
+
+    valid = np.logical_and.reduce([c >= 0 for c in codes])
+    packed = np.zeros(int(valid.sum()), dtype=np.int64)
+    for c, lab in zip(codes, labels):
+        packed = packed * len(lab) + c[valid]
+    groups, counts = np.unique(pd.unique(packed) // len(labels[-1]), return_counts=True)
+
+    # Unpack the group keys back into one index level per `by` column
+    levels = {}
+    for col, lab in zip(reversed(by), reversed(labels[:-1])):
+        groups, level_codes = np.divmod(groups, len(lab))
+        if isinstance(frame[col].dtype, pd.CategoricalDtype):
+            levels[col] = pd.CategoricalIndex(pd.Categorical.from_codes(level_codes, dtype=frame[col].dtype))
+        else:
+            levels[col] = lab.take(level_codes)
+    index = pd.MultiIndex.from_arrays([levels[col] for col in by], names=list(by))
+    return pd.Series(counts, index=index if len(by) > 1 else index.get_level_values(0))
+
+
+def compute_cat_stats(filtered_df: pd.DataFrame) -> tuple[pd.DataFrame, float]:
+    # 1. Calculate Total for this view (to get %)
+    total_view_gsv = filtered_df['GSV'].sum()
+
+    # 2. Group by Staff
+    cat_stats = filtered_df.groupby('SalesPerson', sort=False, observed=True).agg(
+        Sales=('GSV', 'sum'),
+        Qty=('Quantity', 'sum')
+    )
+    cat_stats['Bills'] = count_bills_per_staff(filtered_df).reindex(cat_stats.index, fill_value=0)
+    cat_stats = cat_stats.reset_index()
+
+    # 3. Add Percentage Column
+    cat_stats['Contrib %'] = (cat_stats['Sales'] / total_view_gsv) * 100
+
+    # 4. Sort and Clean
+    cat_stats = cat_stats.sort_values('Sales', ascending=False).set_index('SalesPerson')
+    return cat_stats, total_view_gsv
+
+
+def category_agg(df_sales: pd.DataFrame) -> dict:
+    # Staff breakdown for every (Category, Sub-Category) selection the tab offers,
+    # including the 'All' roll-ups, so a selectbox change is a dict lookup. Each
+    # level is one grouped pass keyed on (..., SalesPerson), then split per selection.
+    out = {('All', 'All'): compute_cat_stats(df_sales)}
+    for keys in (['Category'], ['Category', 'SubCategory']):
+        by = [*keys, 'SalesPerson']
+        stats = df_sales.groupby(by, sort=False, observed=True).agg(Sales=('GSV', 'sum'), Qty=('Quantity', 'sum'))
+        stats['Bills'] = count_bills_per_staff(df_sales, by=tuple(by)).reindex(stats.index, fill_value=0)
+
+        totals = df_sales.groupby(keys, sort=False, observed=True)['GSV'].sum()
+        stats['Contrib %'] = (stats['Sales'] / totals.reindex(stats.index.droplevel('SalesPerson')).to_numpy()) * 100
+        stats = stats.sort_values('Sales', ascending=False)
+
+        for key, part in stats.groupby(level=keys, sort=False, observed=True):
+            # pandas < 3 yields a scalar rather than a 1-tuple for a single level
+            key = key if isinstance(key, tuple) else (key,)
+            total = totals.loc[key] if len(keys) > 1 else totals.loc[key[0]]
+            out[key if len(keys) > 1 else (key[0], 'All')] = (part.droplevel(keys), total)
+    return out
+
+
+def category_options(df_sales: pd.DataFrame) -> dict:
+    # Sub-categories under each category, so the tab 2 dropdowns never scan the frame.
+    # Both columns have sorted categories, so the distinct (category, sub-category)
+    # code pairs come out of np.unique already in display order.
+    cat, sub = df_sales['Category'].cat, df_sales['SubCategory'].cat
+    cat_codes = cat.codes.to_numpy()
+    has_cat = cat_codes >= 0
+    n_sub = len(sub.categories) + 1  # slot 0 is a missing sub-category
+    pairs = np.unique(cat_codes[has_cat].astype(np.int64) * n_sub + sub.codes.to_numpy()[has_cat] + 1)
+
+    options = {}
+    for c, s in zip(pairs // n_sub, pairs % n_sub):
+        subs = options.setdefault(cat.categories[c], [])
+        if s:
+            subs.append(sub.categories[s - 1])
+    return options
+
+
+def membership_by_day(df_memberships: pd.DataFrame) -> pd.DataFrame:
+    # Memberships sold per (date, price tier): one bincount over the paired codes,
+    # reshaped into the date x tier grid
+    tier = df_memberships['Price_Tier'].cat
+    date_codes, dates = pd.factorize(df_memberships['BillDate'], sort=True)
+    tier_codes = tier.codes.to_numpy()
+    valid = (date_codes >= 0) & (tier_codes >= 0)
+    n_tiers = len(tier.categories)
+    counts = np.bincount(date_codes[valid] * n_tiers + tier_codes[valid], minlength=len(dates) * n_tiers)
+    day_mem = pd.DataFrame(
+        counts.reshape(len(dates), n_tiers),
+        index=pd.Index(dates, name='BillDate'),
+        columns=pd.CategoricalIndex(tier.categories, categories=tier.categories, name='Price_Tier')
+    )
+    return day_mem.iloc[::-1]
+
+
+def sales_by_day(df_sales: pd.DataFrame) -> pd.DataFrame:
+    # Day-wise GSV for the trends tab; rows keep the newest-first order of df_sales
+    return df_sales.groupby(['BillDate', 'Day'], sort=False, observed=True).agg(GSV=('GSV', 'sum')).reset_index()
+
+
+def sales_by_week(df_sales: pd.DataFrame) -> pd.DataFrame:
+    # Week-wise GSV in Week_Label category order
+    return df_sales.groupby('Week_Label', sort=False, observed=True).agg(GSV=('GSV', 'sum')).sort_index().reset_index()
+
+
+def compute_weekly(df_sales: pd.DataFrame) -> pd.DataFrame:
+    # (Week, SalesPerson) totals for the incentive check, built once in the loader
+    w_stats = df_sales.groupby(['Week', 'SalesPerson'], sort=False, observed=True).agg(W_GSV=('GSV', 'sum'), W_Qty=('Quantity', 'sum'))
+    w_bills = count_bills_per_staff(df_sales, by=('Week', 'SalesPerson')).rename('W_Bills')
+    # Sorted once here so every .loc[week] is a slice of a lexsorted index
+    return pd.concat([w_stats, w_bills], axis=1, join='inner').sort_index()
+
+
+@st.cache_data(show_spinner=False)
+def weekly_qualifiers(digest: str, week: int, _file_bytes: bytes) -> pd.DataFrame | None:
+    # Incentive winners for one week, memoized per (upload, week); None when the week has no sales
+    weekly_master = load_and_prepare(digest, _file_bytes)['weekly_kpi']
+    if week not in weekly_master.index.get_level_values('Week'):
+        return None
+
+    w_merged = weekly_master.loc[week].reset_index()
+    w_merged['W_AVPT'] = (w_merged['W_GSV'] / w_merged['W_Bills'])
+    w_merged['W_AUPT'] = (w_merged['W_Qty'] / w_merged['W_Bills'])
+    winners = w_merged[(w_merged['W_AUPT'] >= 4) & (w_merged['W_AVPT'] >= 3000)]
+    return winners.sort_values('SalesPerson')
+
+
+@st.fragment
+def paged_dataframe(frame: pd.DataFrame, key: str, rows: int = PAGE_ROWS, **kwargs) -> None:
+    # Slice a long table server-side so each rerun serializes one page, not the whole
+    # frame; as a fragment, turning the page reruns only this table, outside the
+    # main try/except, so it shows its own error banner
+    try:
+        n_pages = -(-len(frame) // rows)
+        if n_pages > 1:
+            page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, step=1, key=key)
+            frame = frame.iloc[(page - 1) * rows:page * rows]
+        st.dataframe(frame, **kwargs)
+    except Exception as e:
+        st.error(f"🚨 An error occurred: {e}")
+
+
+@st.cache_resource(ttl=60, show_spinner=False)
+def resolve_branding() -> dict:
+    # First existing logo / store photo, re-checked at most once a minute
+    return {
+        'logo': next((p for p in ('logo.png', 'logo.jpg') if os.path.exists(p)), None),
+        'store': next((p for p in ('store.png', 'store.jpg') if os.path.exists(p)), None),
+    }
+
+
 # --- SIDEBAR: SETTINGS ---
 with st.sidebar:
     st.header("⚙️ Dashboard Settings")
@@ -17,9 +505,10 @@ with st.sidebar:
     st.caption("Place 'logo.png' & 'store.png' in folder for auto-load.")
     
     # Fallback Uploads
-    if not os.path.exists("logo.png") and not os.path.exists("logo.jpg"):
+    branding = resolve_branding()
+    if branding['logo'] is None:
         st.file_uploader("Upload Logo", type=['png', 'jpg'])
-    if not os.path.exists("store.png") and not os.path.exists("store.jpg"):
+    if branding['store'] is None:
         st.file_uploader("Upload Store Photo", type=['png', 'jpg'])
 
 # --- HEADER LOGIC ---
@@ -27,8 +516,7 @@ col1, col2, col3 = st.columns([1, 4, 2])
 
 # Logo
 with col1:
-    if os.path.exists("logo.png"): st.image("logo.png", width=150)
-    elif os.path.exists("logo.jpg"): st.image("logo.jpg", width=150)
+    if branding['logo']: st.image(branding['logo'], width=150)
     else: st.write("📷 *No Logo*")
 
 # Title
@@ -38,66 +526,18 @@ with col2:
 
 # Store Photo
 with col3:
-    if os.path.exists("store.png"): st.image("store.png", width=300)
-    elif os.path.exists("store.jpg"): st.image("store.jpg", width=300)
+    if branding['store']: st.image(branding['store'], width=300)
 
 st.markdown("---")
 
 # --- MAIN LOGIC ---
 if article_file:
     try:
-        # 1. LOAD & CLEAN
-        df = pd.read_csv(article_file)
-        df.columns = df.columns.str.strip()
-        
-        rename_map = {'SalePerson': 'SalesPerson', 'Date': 'BillDate', 'Bill Date': 'BillDate', 'BillDate': 'BillDate'}
-        df.rename(columns=rename_map, inplace=True)
-
-        # 2. DATE FIX
-        df['BillDate'] = pd.to_datetime(df['BillDate'], dayfirst=True, errors='coerce')
-        df = df.dropna(subset=['BillDate'])
-        
-        # 3. WEEK LOGIC
-        df['Day_Num'] = df['BillDate'].dt.day
-        df['Week'] = (df['Day_Num'] - 1) // 7 + 1
-        df['Week_Label'] = "Week " + df['Week'].astype(str)
-        df['Day'] = df['BillDate'].dt.strftime('%A')
-        
-        # 4. SEPARATE STREAMS
-        mask_mem = df['ProductName'].str.contains('Membership', case=False, na=False) | (df['Category'] == 'GiftCertificate')
-        df_memberships = df[mask_mem].copy()
-
-        exclusions = ['Free Sample Category']
-        df_sales = df[~df['Category'].isin(exclusions)].copy()
-
-        # 5. MASTER KPI CALCULATIONS (GSV)
-        staff_stats = df_sales.groupby('SalesPerson').agg(
-            Total_GSV=('GSV', 'sum'),
-            Total_Qty=('Quantity', 'sum')
-        ).reset_index()
-
-        bill_counts = df_sales.groupby('SalesPerson')['InvoiceNumber'].nunique().reset_index(name='Total_Bills')
-        
-        # Single Bills
-        bill_group = df_sales.groupby(['InvoiceNumber', 'SalesPerson'])['Quantity'].sum().reset_index()
-        single_bills = bill_group[bill_group['Quantity'] == 1]
-        sb_counts = single_bills.groupby('SalesPerson').size().reset_index(name='Single_Bills')
-        
-        # Merge
-        master_df = pd.merge(staff_stats, bill_counts, on='SalesPerson', how='left')
-        master_df = pd.merge(master_df, sb_counts, on='SalesPerson', how='left').fillna(0)
-        master_df['Total_Bills'] = master_df['Total_Bills'].replace(0, 1)
-        
-        # Ratios
-        master_df['AVPT'] = (master_df['Total_GSV'] / master_df['Total_Bills']).round(0)
-        master_df['AUPT'] = (master_df['Total_Qty'] / master_df['Total_Bills']).round(2)
-        master_df['Single_Bill_%'] = ((master_df['Single_Bills'] / master_df['Total_Bills']) * 100).round(1)
-
-        # Ranking
-        master_df = master_df.sort_values('Total_GSV', ascending=False).reset_index(drop=True)
-        master_df.index += 1
-        master_df['Rank'] = master_df.index
-        master_df = master_df[['Rank', 'SalesPerson', 'Total_GSV', 'Total_Qty', 'Total_Bills', 'AVPT', 'AUPT', 'Single_Bills', 'Single_Bill_%']]
+        file_bytes = article_file.getvalue()
+        digest = file_digest(file_bytes)
+        bundle = load_and_prepare(digest, file_bytes)
+        df, df_memberships = bundle['df'], bundle['df_memberships']
+        master_df = bundle['master_df']
 
         # --- TABS ---
         tab1, tab2, tab3, tab4, tab5 = st.tabs([
@@ -110,101 +550,89 @@ if article_file:
 
         with tab1:
             st.subheader("🏆 Staff Rankings (GSV)")
-            st.dataframe(master_df.style.format({'Total_GSV': '₹{:.2f}', 'AVPT': '₹{:.0f}'}), use_container_width=True)
+            st.dataframe(master_df, column_config={
+                'Total_GSV': st.column_config.NumberColumn(format='₹%.2f'),
+                'AVPT': st.column_config.NumberColumn(format='₹%.0f')
+            }, use_container_width=True)
             
             st.markdown("---")
             st.write("### 🎯 Weekly Incentive Qualifiers (Current Week)")
             if not df['Week'].empty:
                 current_week = df['Week'].max()
-                weekly_df = df_sales[df_sales['Week'] == current_week]
+                winners = weekly_qualifiers(digest, int(current_week), file_bytes)
                 
-                if not weekly_df.empty:
-                    w_stats = weekly_df.groupby('SalesPerson').agg(W_GSV=('GSV', 'sum'), W_Qty=('Quantity', 'sum')).reset_index()
-                    w_bills = weekly_df.groupby('SalesPerson')['InvoiceNumber'].nunique().reset_index(name='W_Bills')
-                    w_merged = pd.merge(w_stats, w_bills, on='SalesPerson')
-                    w_merged['W_AVPT'] = (w_merged['W_GSV'] / w_merged['W_Bills'])
-                    w_merged['W_AUPT'] = (w_merged['W_Qty'] / w_merged['W_Bills'])
-                    
-                    winners = w_merged[(w_merged['W_AUPT'] >= 4) & (w_merged['W_AVPT'] >= 3000)]
-                    
+                if winners is not None:
                     if not winners.empty:
                         st.success(f"🎉 Winners for Week {current_week}")
-                        st.dataframe(winners[['SalesPerson', 'W_AVPT', 'W_AUPT']].style.format({'W_AVPT': '₹{:.0f}'}))
+                        st.dataframe(winners[['SalesPerson', 'W_AVPT', 'W_AUPT']], column_config={
+                            'W_AVPT': st.column_config.NumberColumn(format='₹%.0f')
+                        })
                     else:
                         st.warning(f"No winners yet for Week {current_week}.")
 
         # --- TAB 2: SIMPLIFIED & TRANSPOSED CATEGORY ANALYSIS ---
         with tab2:
-            st.subheader("🔍 Category & Sub-Category Performance")
-            
-            # Selectors
-            cats = ['All'] + sorted(list(df_sales['Category'].dropna().unique()))
-            col_cat, col_sub, col_toggle = st.columns([2, 2, 1])
-            
-            selected_cat = col_cat.selectbox("Select Category", cats)
-            
-            if selected_cat != 'All':
-                sub_cats = ['All'] + sorted(list(df_sales[df_sales['Category'] == selected_cat]['SubCategory'].dropna().unique()))
-            else:
-                sub_cats = ['All']
-            
-            selected_sub = col_sub.selectbox("Select Sub-Category", sub_cats)
-            
-            # Filter Data
-            filtered_df = df_sales.copy()
-            if selected_cat != 'All': filtered_df = filtered_df[filtered_df['Category'] == selected_cat]
-            if selected_sub != 'All': filtered_df = filtered_df[filtered_df['SubCategory'] == selected_sub]
-
-            # Calculation
-            if not filtered_df.empty:
-                # 1. Calculate Total for this view (to get %)
-                total_view_gsv = filtered_df['GSV'].sum()
-                
-                # 2. Group by Staff
-                cat_stats = filtered_df.groupby('SalesPerson').agg(
-                    Sales=('GSV', 'sum'),
-                    Qty=('Quantity', 'sum'),
-                    Bills=('InvoiceNumber', 'nunique')
-                ).reset_index()
-                
-                # 3. Add Percentage Column
-                cat_stats['Contrib %'] = (cat_stats['Sales'] / total_view_gsv) * 100
-                
-                # 4. Sort and Clean
-                cat_stats = cat_stats.sort_values('Sales', ascending=False).set_index('SalesPerson')
-                
-                # 5. TRANSPOSE TOGGLE
-                transpose_view = col_toggle.checkbox("🔄 Transpose View")
-                
-                st.markdown(f"**Total Sales for Selection:** ₹{total_view_gsv:,.2f}")
-                
-                if transpose_view:
-                    # Show Horizontal (Staff Name on Top, KPIs on Side)
-                    st.dataframe(
-                        cat_stats.T.style.format("{:.2f}"), 
-                        use_container_width=True
-                    )
-                else:
-                    # Show Vertical (Staff Name on Side, KPIs on Top)
-                    # Reorder columns to put % next to sales
-                    cat_stats = cat_stats[['Sales', 'Contrib %', 'Qty', 'Bills']]
-                    st.dataframe(
-                        cat_stats.style.format({
-                            'Sales': '₹{:.2f}', 
-                            'Contrib %': '{:.1f}%'
-                        }), 
-                        use_container_width=True
-                    )
-                
-            else:
-                st.warning("No data found for this selection.")
+            # Run as a fragment: changing a selector reruns only this tab, not the whole script
+            @st.fragment
+            def category_analysis():
+                # Its own error banner: a fragment rerun is outside the outer try/except
+                try:
+                    st.subheader("🔍 Category & Sub-Category Performance")
+
+                    # Selectors
+                    sub_cats_by_cat = bundle['sub_cats_by_cat']
+                    cats = ['All'] + list(sub_cats_by_cat)
+                    col_cat, col_sub, col_toggle = st.columns([2, 2, 1])
+
+                    selected_cat = col_cat.selectbox("Select Category", cats)
+
+                    if selected_cat != 'All':
+                        sub_cats = ['All'] + sub_cats_by_cat.get(selected_cat, [])
+                    else:
+                        sub_cats = ['All']
+
+                    selected_sub = col_sub.selectbox("Select Sub-Category", sub_cats)
+
+                    # Calculation
+                    cat_stats, total_view_gsv = bundle['cat_agg'].get((selected_cat, selected_sub), (None, 0.0))
+                    if cat_stats is not None:
+                        # 5. TRANSPOSE TOGGLE
+                        transpose_view = col_toggle.checkbox("🔄 Transpose View")
+
+                        st.markdown(f"**Total Sales for Selection:** ₹{total_view_gsv:,.2f}")
+
+                        if transpose_view:
+                            # Show Horizontal (Staff Name on Top, KPIs on Side)
+                            cat_stats_t = cat_stats.T
+                            st.dataframe(
+                                cat_stats_t,
+                                column_config={str(c): st.column_config.NumberColumn(format='%.2f') for c in cat_stats_t.columns},
+                                use_container_width=True
+                            )
+                        else:
+                            # Show Vertical (Staff Name on Side, KPIs on Top)
+                            # Reorder columns to put % next to sales
+                            cat_stats = cat_stats[['Sales', 'Contrib %', 'Qty', 'Bills']]
+                            st.dataframe(
+                                cat_stats,
+                                column_config={
+                                    'Sales': st.column_config.NumberColumn(format='₹%.2f'),
+                                    'Contrib %': st.column_config.NumberColumn(format='%.1f%%')
+                                },
+                                use_container_width=True
+                            )
+
+                    else:
+                        st.warning("No data found for this selection.")
+                except Exception as e:
+                    st.error(f"🚨 An error occurred: {e}")
+
+            category_analysis()
 
         with tab3:
             st.subheader("💳 Membership Hub")
             if not df_memberships.empty:
-                df_memberships['Price_Tier'] = "₹" + df_memberships['GSV'].astype(str)
-                day_mem = df_memberships.groupby(['BillDate', 'Price_Tier']).size().unstack(fill_value=0).sort_index(ascending=False)
-                st.dataframe(day_mem, use_container_width=True)
+                paged_dataframe(bundle['day_mem'], 'day_mem_page', use_container_width=True)
             else:
                 st.info("No memberships found.")
 
@@ -212,16 +640,16 @@ if article_file:
             col1, col2 = st.columns(2)
             with col1:
                 st.subheader("📅 Day-wise Sales")
-                day_view = df_sales.groupby(['BillDate', 'Day']).agg(GSV=('GSV', 'sum')).reset_index().sort_values('BillDate', ascending=False)
-                st.dataframe(day_view.style.format({'GSV': '₹{:.2f}'}), use_container_width=True)
+                paged_dataframe(bundle['day_view'], 'day_view_page', column_config={'GSV': st.column_config.NumberColumn(format='₹%.2f')}, use_container_width=True)
             with col2:
                 st.subheader("🗓️ Week-wise Sales")
-                week_view = df_sales.groupby('Week_Label').agg(GSV=('GSV', 'sum')).reset_index()
-                st.dataframe(week_view.style.format({'GSV': '₹{:.2f}'}), use_container_width=True)
+                st.dataframe(bundle['week_view'], column_config={'GSV': st.column_config.NumberColumn(format='₹%.2f')}, use_container_width=True)
 
         with tab5:
             st.subheader("⚠️ Single Bill Risk")
-            st.dataframe(master_df[['Rank', 'SalesPerson', 'Total_Bills', 'Single_Bills', 'Single_Bill_%']].style.format({'Single_Bill_%': '{:.1f}%'}), use_container_width=True)
+            st.dataframe(master_df[['Rank', 'SalesPerson', 'Total_Bills', 'Single_Bills', 'Single_Bill_%']], column_config={
+                'Single_Bill_%': st.column_config.NumberColumn(format='%.1f%%')
+            }, use_container_width=True)
 
     except Exception as e:
         st.error(f"🚨 An error occurred: {e}")